@@ -1,21 +1,61 @@
-import json
+import hashlib
+import mmap
 import os
-from io import BytesIO
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
 
-from flask import Flask, request, jsonify, send_file
+import orjson
+from flask import Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS  # Add this import
 
 from providers.aliyun import AliyunFactory
 from providers.cloudflare import CloudflareFactory
 from providers.modelscope import ModelScopeFactory
 
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    基于orjson的JSON序列化，供jsonify等使用。
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Enable CORS for all routes with wildcard origin
 
+# 限制请求体大小，超限的上传在解析前即被拒绝
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
 # 加载配置文件
 CONFIG_PATH = "models_config.json"
-with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-    MODELS_CONFIG = json.load(f)
+with open(CONFIG_PATH, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+    # 直接解析映射的文件内容，避免先读入一份完整副本；
+    # 任务名在各模型间大量重复，驻留后共享同一字符串对象
+    MODELS_CONFIG = {
+        provider: {model: [sys.intern(task) for task in tasks] for model, tasks in models.items()}
+        for provider, models in orjson.loads(view).items()
+    }
+
+# 预先展开配置，请求校验时只需做集合查找
+VALID_MODELS = frozenset((p, m) for p, models in MODELS_CONFIG.items() for m in models)
+VALID_TRIPLES = frozenset(
+    (p, m, t) for p, models in MODELS_CONFIG.items() for m, tasks in models.items() for t in tasks
+)
+VALID_TASKS = frozenset({"text_to_image", "image_to_image"})
+WILDCARD_TASKS = {p: frozenset(models["*"]) for p, models in MODELS_CONFIG.items() if "*" in models}
+
+# 预先序列化配置，/models 直接返回该字节串
+MODELS_CONFIG_JSON = orjson.dumps(MODELS_CONFIG)
 
 # 假设API密钥存储在环境变量中（实际使用时需设置）
 CLOUDFLARE_ACCOUNT_ID = os.getenv("CLOUDFLARE_ACCOUNT_ID", "your_cloudflare_account_id")
@@ -30,6 +70,42 @@ PROVIDER_FACTORIES = {
     "aliyun": AliyunFactory(DASHSCOPE_API_KEY)
 }
 
+# 生成结果缓存：相同请求直接返回已生成的图像，并发的相同请求只调用一次提供者。
+# 请求不含seed，相同提示词重复提交通常期望得到新图像，因此默认关闭（为0时流式返回）。
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "0"))
+# 缓存图像的总字节数上限
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 等待相同请求生成结果的最长时间（秒）
+GENERATION_WAIT_TIMEOUT = 300
+GENERATION_CACHE: OrderedDict[str, bytes] = OrderedDict()
+GENERATION_CACHE_BYTES = 0
+INFLIGHT_GENERATIONS: dict[str, Future] = {}
+GENERATION_LOCK = threading.Lock()
+
+# 配置中的每个供应商都必须有对应的工厂，请求时无需再次检查
+assert MODELS_CONFIG.keys() <= PROVIDER_FACTORIES.keys(), "config/provider mismatch"
+
+# 预先序列化的固定错误消息
+ERR_REQUEST_TOO_LARGE = orjson.dumps({"error": f"Request body exceeds {MAX_CONTENT_LENGTH // (1024 * 1024)} MB limit."})
+ERR_MISSING_PARAMS = orjson.dumps({"error": "Missing required parameters: provider, model, task, prompt"})
+ERR_INVALID_TASK = orjson.dumps({"error": "Invalid task type. Use 'text_to_image' or 'image_to_image'."})
+ERR_MISSING_IMAGE = orjson.dumps({"error": "Missing 'image' file for image-to-image task."})
+ERR_NO_SELECTED_FILE = orjson.dumps({"error": "No selected file for 'image'."})
+
+
+def error_response(body: bytes, status: int) -> Response:
+    """
+    使用预先序列化的JSON错误消息构建响应。
+
+    Args:
+        body (bytes): JSON错误消息。
+        status (int): HTTP状态码。
+
+    Returns:
+        Response: JSON响应。
+    """
+    return Response(body, status=status, mimetype="application/json")
+
 
 def validate_request(provider: str, model: str, task: str) -> tuple[bool, str]:
     """
@@ -47,21 +123,106 @@ def validate_request(provider: str, model: str, task: str) -> tuple[bool, str]:
     if provider not in MODELS_CONFIG:
         return False, f"Provider '{provider}' not found in configuration."
 
-    provider_models = MODELS_CONFIG[provider]
-
-    # 检查模型名是否有效
-    if "*" in provider_models:  # 通配符支持（如ModelScope）
-        if task not in provider_models["*"]:
+    # 通配符支持（如ModelScope）
+    wildcard_tasks = WILDCARD_TASKS.get(provider)
+    if wildcard_tasks is not None:
+        if task not in wildcard_tasks:
             return False, f"Task '{task}' not supported by any model under provider '{provider}'."
-    else:
-        if model not in provider_models:
+    elif (provider, model, task) not in VALID_TRIPLES:
+        if (provider, model) not in VALID_MODELS:
             return False, f"Model '{model}' not found under provider '{provider}'."
-        if task not in provider_models[model]:
-            return False, f"Task '{task}' not supported by model '{model}' under provider '{provider}'."
+        return False, f"Task '{task}' not supported by model '{model}' under provider '{provider}'."
 
     return True, ""
 
 
+def generation_key(provider: str, model: str, task: str, prompt: str, input_image: bytes | None) -> str:
+    """
+    计算生成请求的缓存键。
+
+    Args:
+        provider (str): 供应商名。
+        model (str): 模型名。
+        task (str): 任务类型。
+        prompt (str): 文本提示。
+        input_image (bytes | None): 输入图像的字节内容（仅image_to_image）。
+
+    Returns:
+        str: 请求参数的blake2b摘要。
+    """
+    hasher = hashlib.blake2b(orjson.dumps([provider, model, task, prompt]), digest_size=16)
+    if input_image is not None:
+        hasher.update(input_image)
+    return hasher.hexdigest()
+
+
+def generate_cached(provider_instance, key: str, task: str, **params) -> bytes:
+    """
+    带缓存的图像生成：命中缓存直接返回，相同请求正在生成时等待其结果，否则调用提供者并写入缓存。
+
+    Args:
+        provider_instance (ImageProvider): 提供者实例。
+        key (str): 由generation_key计算的缓存键。
+        task (str): 任务类型。
+        **params: 传给provider_instance.generate的参数。
+
+    Returns:
+        bytes: 生成图像的字节内容。
+
+    Raises:
+        TimeoutError: 如果等待相同请求的结果超时。
+    """
+    global GENERATION_CACHE_BYTES
+
+    with GENERATION_LOCK:
+        image_bytes = GENERATION_CACHE.get(key)
+        if image_bytes is not None:
+            GENERATION_CACHE.move_to_end(key)
+            return image_bytes
+        future = INFLIGHT_GENERATIONS.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = INFLIGHT_GENERATIONS[key] = Future()
+
+    if not is_owner:
+        try:
+            return future.result(timeout=GENERATION_WAIT_TIMEOUT)
+        except TimeoutError:
+            raise TimeoutError(
+                f"Identical in-flight generation did not complete within {GENERATION_WAIT_TIMEOUT} seconds."
+            ) from None
+
+    try:
+        image_bytes = b"".join(provider_instance.generate(task, **params))
+    except BaseException as e:
+        with GENERATION_LOCK:
+            del INFLIGHT_GENERATIONS[key]
+        future.set_exception(e)
+        raise
+
+    with GENERATION_LOCK:
+        # 超过总字节数上限的单张图像不缓存
+        if len(image_bytes) <= GENERATION_CACHE_MAX_BYTES:
+            GENERATION_CACHE[key] = image_bytes
+            GENERATION_CACHE_BYTES += len(image_bytes)
+            # 按LRU顺序淘汰，直到条目数和总字节数均不超过上限
+            while (len(GENERATION_CACHE) > GENERATION_CACHE_SIZE
+                   or GENERATION_CACHE_BYTES > GENERATION_CACHE_MAX_BYTES):
+                _, evicted = GENERATION_CACHE.popitem(last=False)
+                GENERATION_CACHE_BYTES -= len(evicted)
+        del INFLIGHT_GENERATIONS[key]
+    future.set_result(image_bytes)
+    return image_bytes
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """
+    请求体超过MAX_CONTENT_LENGTH时返回JSON错误消息。
+    """
+    return error_response(ERR_REQUEST_TOO_LARGE, 413)
+
+
 @app.route("/generate", methods=["POST"])
 def generate_image():
     """
@@ -85,11 +246,11 @@ def generate_image():
     prompt = request.form.get("prompt")
 
     # 基本参数校验
-    if not all([provider, model, task, prompt]):
-        return jsonify({"error": "Missing required parameters: provider, model, task, prompt"}), 400
+    if not (provider and model and task and prompt):
+        return error_response(ERR_MISSING_PARAMS, 400)
 
-    if task not in ["text_to_image", "image_to_image"]:
-        return jsonify({"error": "Invalid task type. Use 'text_to_image' or 'image_to_image'."}), 400
+    if task not in VALID_TASKS:
+        return error_response(ERR_INVALID_TASK, 400)
 
     # 校验配置
     is_valid, error_msg = validate_request(provider, model, task)
@@ -100,32 +261,29 @@ def generate_image():
     input_image = None
     if task == "image_to_image":
         if "image" not in request.files:
-            return jsonify({"error": "Missing 'image' file for image-to-image task."}), 400
+            return error_response(ERR_MISSING_IMAGE, 400)
         image_file = request.files["image"]
         if image_file.filename == "":
-            return jsonify({"error": "No selected file for 'image'."}), 400
+            return error_response(ERR_NO_SELECTED_FILE, 400)
         input_image = image_file.read()
 
-    # 创建提供者实例
-    if provider not in PROVIDER_FACTORIES:
-        return jsonify({"error": f"Provider '{provider}' is not implemented."}), 500
-    factory = PROVIDER_FACTORIES[provider]
-    provider_instance = factory.create_provider(model)
+    # 创建提供者实例（供应商已在validate_request中校验）
+    provider_instance = PROVIDER_FACTORIES[provider].create_provider(model)
 
     # 生成图像
+    params = {"prompt": prompt}
+    if task == "image_to_image":
+        params["input_image"] = input_image
     try:
-        if task == "text_to_image":
-            image_bytes = provider_instance.generate("text_to_image", prompt=prompt)
-        else:  # image_to_image
-            image_bytes = provider_instance.generate("image_to_image", prompt=prompt, input_image=input_image)
-
-        # 返回图像文件
-        return send_file(
-            BytesIO(image_bytes),
-            mimetype="image/png",
-            as_attachment=True,
-            download_name="generated_image.png"
-        )
+        if GENERATION_CACHE_SIZE > 0:
+            key = generation_key(provider, model, task, prompt, input_image)
+            response = Response(generate_cached(provider_instance, key, task, **params), mimetype="image/png")
+        else:
+            # 将上游图像按块直接转发给客户端
+            image_stream = provider_instance.generate(task, **params)
+            response = Response(image_stream, mimetype="image/png", direct_passthrough=True)
+        response.headers["Content-Disposition"] = 'attachment; filename="generated_image.png"'
+        return response
     except Exception as e:
         return jsonify({"error": f"Image generation failed: {str(e)}"}), 500
 
@@ -138,11 +296,7 @@ def list_models():
     Returns:
         JSON: models_config.json的内容。
     """
-    try:
-        # 直接返回加载的配置
-        return jsonify(MODELS_CONFIG), 200
-    except Exception as e:
-        return jsonify({"error": f"Failed to load models configuration: {str(e)}"}), 500
+    return Response(MODELS_CONFIG_JSON, mimetype="application/json")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,55 @@
-import os
-import tempfile
+import uuid
 from http import HTTPStatus
+from typing import Iterator
 
-import requests
 from dashscope import ImageSynthesis
-
-from providers.provider import ImageProvider
+from dashscope.utils.oss_utils import OssUtils
+
+from providers.provider import MAX_CACHED_PROVIDERS, REQUEST_TIMEOUT, SESSION, ImageProvider
+
+
+def _build_sd_params(api_key: str, model_name: str, prompt: str, kwargs: dict) -> dict:
+    """
+    构建Stable Diffusion系列模型的调用参数。
+    """
+    return {
+        "api_key": api_key,
+        "model": model_name,
+        "prompt": prompt,
+        "n": kwargs.get("n", 1),
+        "size": kwargs.get("size", "1024*1024"),
+        "negative_prompt": kwargs.get("negative_prompt", "")
+    }
+
+
+def _build_wanx_text_to_image_params(api_key: str, model_name: str, prompt: str, kwargs: dict) -> dict:
+    """
+    构建非Stable Diffusion模型（如wanx_v1）文生图的调用参数。
+    """
+    return {
+        "api_key": api_key,
+        "model": model_name,
+        "prompt": prompt,
+        "n": kwargs.get("n", 1),
+        "size": kwargs.get("size", "1024*1024"),
+        "style": kwargs.get("style", "<auto>")
+    }
+
+
+def _build_wanx_image_to_image_params(api_key: str, model_name: str, prompt: str, kwargs: dict) -> dict:
+    """
+    构建非Stable Diffusion模型（如wanx_v1）图文生图的调用参数。
+    """
+    return {
+        "api_key": api_key,
+        "model": model_name,
+        "prompt": prompt,
+        "n": kwargs.get("n", 1),
+        "size": kwargs.get("size", "1024*1024"),
+        "style": kwargs.get("style", "<auto>"),
+        "ref_mode": kwargs.get("ref_mode", "repaint"),
+        "ref_strength": kwargs.get("ref_strength", 1.0)
+    }
 
 
 class AliyunProvider(ImageProvider):
@@ -19,17 +63,53 @@ class AliyunProvider(ImageProvider):
         """
         self._api_key = api_key
         self._model_name = model_name
+        # 根据模型类型选定参数构建函数
+        if model_name.startswith("stable-diffusion"):
+            self._build_text_to_image_params = _build_sd_params
+            self._build_image_to_image_params = _build_sd_params
+        else:
+            self._build_text_to_image_params = _build_wanx_text_to_image_params
+            self._build_image_to_image_params = _build_wanx_image_to_image_params
 
-    def _is_stable_diffusion_model(self):
+    def _upload_input_image(self, input_image: bytes) -> str:
         """
-        检查模型是否为Stable Diffusion系列。
+        将输入图像直接上传至DashScope临时存储，无需先写入本地文件。
+
+        Args:
+            input_image (bytes): 输入图像的字节内容。
 
         Returns:
-            bool: True 如果模型名以"stable-diffusion"开头。
+            str: 上传后的oss://资源地址。
         """
-        return self._model_name.startswith("stable-diffusion")
+        certificate = OssUtils.get_upload_certificate(model=self._model_name, api_key=self._api_key)
+        if certificate.status_code != HTTPStatus.OK:
+            raise ValueError(
+                f"Get upload certificate failed, code: {certificate.code}, message: {certificate.message}"
+            )
 
-    def text_to_image(self, prompt: str, **kwargs) -> bytes:
+        policy = certificate.output
+        file_name = f"{uuid.uuid4().hex}.png"
+        key = f"{policy['upload_dir']}/{file_name}"
+        form_data = {
+            "OSSAccessKeyId": policy["oss_access_key_id"],
+            "Signature": policy["signature"],
+            "policy": policy["policy"],
+            "key": key,
+            "x-oss-object-acl": policy["x_oss_object_acl"],
+            "x-oss-forbid-overwrite": policy["x_oss_forbid_overwrite"],
+            "success_action_status": "200",
+            "x-oss-content-type": "image/png"
+        }
+        response = SESSION.post(
+            policy["upload_host"],
+            data=form_data,
+            files={"file": (file_name, input_image, "image/png")},
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        return f"oss://{key}"
+
+    def text_to_image(self, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         使用Aliyun DashScope API从文本生成图像（同步调用，返回URL后下载）。
 
@@ -42,29 +122,10 @@ class AliyunProvider(ImageProvider):
                 - negative_prompt (str): 负提示词（SD模型支持）
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
         """
-        # 根据模型类型调整参数
-        base_params = {
-            "api_key": self._api_key,
-            "model": self._model_name,
-            "prompt": prompt,
-            "n": kwargs.get("n", 1),
-            "size": kwargs.get("size", "1024*1024")
-        }
-
-        if self._is_stable_diffusion_model():
-            # Stable Diffusion 模型特有参数
-            params = {
-                **base_params,
-                "negative_prompt": kwargs.get("negative_prompt", "")
-            }
-        else:
-            # 非Stable Diffusion 模型（如wanx_v1）
-            params = {
-                **base_params,
-                "style": kwargs.get("style", "<auto>")
-            }
+        # 根据模型类型构建参数
+        params = self._build_text_to_image_params(self._api_key, self._model_name, prompt, kwargs)
 
         rsp = ImageSynthesis.call(**params)
 
@@ -80,11 +141,9 @@ class AliyunProvider(ImageProvider):
         # 获取第一张图像
         result = rsp.output.results[0]
         image_url = result.url
-        image_response = requests.get(image_url)
-        image_response.raise_for_status()
-        return image_response.content
+        return self._download_image(image_url)
 
-    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> bytes:
+    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         使用Aliyun DashScope API从图像和文本生成新图像（同步调用，返回URL后下载）。
 
@@ -100,58 +159,31 @@ class AliyunProvider(ImageProvider):
                 - negative_prompt (str): 负提示词（SD模型支持）
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
         """
-        # 将输入图像保存为临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-            temp_file.write(input_image)
-            temp_file_path = temp_file.name
-
-        try:
-            # 根据模型类型调整参数
-            base_params = {
-                "api_key": self._api_key,
-                "model": self._model_name,
-                "prompt": prompt,
-                "n": kwargs.get("n", 1),
-                "size": kwargs.get("size", "1024*1024"),
-                "sketch_image_url": temp_file_path
-            }
-
-            if self._is_stable_diffusion_model():
-                # Stable Diffusion 模型特有参数
-                params = {
-                    **base_params,
-                    "negative_prompt": kwargs.get("negative_prompt", "")
-                }
-            else:
-                # 非Stable Diffusion 模型（如wanx_v1）
-                params = {
-                    **base_params,
-                    "style": kwargs.get("style", "<auto>"),
-                    "ref_mode": kwargs.get("ref_mode", "repaint"),
-                    "ref_strength": kwargs.get("ref_strength", 1.0)
-                }
-
-            rsp = ImageSynthesis.call(**params)
-
-            if rsp.status_code != HTTPStatus.OK:
-                raise ValueError(
-                    f"Image-to-image failed, status_code: {rsp.status_code}, code: {rsp.code}, message: {rsp.message}"
-                )
-
-            # 检查返回结果，确保有results字段
-            if not hasattr(rsp.output, "results") or not rsp.output.results:
-                raise ValueError(f"Unexpected response format for model '{self._model_name}': no 'results' found.")
-
-            # 获取第一张图像
-            result = rsp.output.results[0]
-            image_url = result.url
-            image_response = requests.get(image_url)
-            image_response.raise_for_status()
-            return image_response.content
-        finally:
-            os.unlink(temp_file_path)
+        # 将输入图像上传至临时存储
+        sketch_image_url = self._upload_input_image(input_image)
+
+        # 根据模型类型构建参数
+        params = self._build_image_to_image_params(self._api_key, self._model_name, prompt, kwargs)
+        params["sketch_image_url"] = sketch_image_url
+
+        # oss://地址需要通知服务端解析临时存储中的资源
+        rsp = ImageSynthesis.call(**params, headers={"X-DashScope-OssResourceResolve": "enable"})
+
+        if rsp.status_code != HTTPStatus.OK:
+            raise ValueError(
+                f"Image-to-image failed, status_code: {rsp.status_code}, code: {rsp.code}, message: {rsp.message}"
+            )
+
+        # 检查返回结果，确保有results字段
+        if not hasattr(rsp.output, "results") or not rsp.output.results:
+            raise ValueError(f"Unexpected response format for model '{self._model_name}': no 'results' found.")
+
+        # 获取第一张图像
+        result = rsp.output.results[0]
+        image_url = result.url
+        return self._download_image(image_url)
 
 
 class AliyunFactory:
@@ -163,15 +195,21 @@ class AliyunFactory:
             api_key (str): DashScope API密钥。
         """
         self._api_key = api_key
+        self._providers: dict[str, AliyunProvider] = {}
 
     def create_provider(self, model_name: str) -> AliyunProvider:
         """
-        根据模型名创建Aliyun提供者实例。
+        根据模型名获取Aliyun提供者实例。
 
         Args:
             model_name (str): 模型名称，例如"wanx_v1"。
 
         Returns:
-            AliyunProvider: 提供者实例。
+            AliyunProvider: 提供者实例，同一模型复用已创建的实例。
         """
-        return AliyunProvider(self._api_key, model_name)
+        provider = self._providers.get(model_name)
+        if provider is None:
+            provider = AliyunProvider(self._api_key, model_name)
+            if len(self._providers) < MAX_CACHED_PROVIDERS:
+                self._providers[model_name] = provider
+        return provider
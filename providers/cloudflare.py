@@ -1,8 +1,7 @@
-import base64
+import binascii
+from typing import Iterator
 
-import requests
-
-from providers.provider import ImageProvider
+from providers.provider import MAX_CACHED_PROVIDERS, REQUEST_TIMEOUT, SESSION, ImageProvider
 
 
 # Cloudflare提供者类
@@ -20,8 +19,9 @@ class CloudflareProvider(ImageProvider):
         self._api_token = api_token
         self._model_name = model_name
         self._base_url = f"https://api.cloudflare.com/client/v4/accounts/{account_id}/ai/run/{model_name}"
+        self._headers = {"Authorization": f"Bearer {api_token}"}
 
-    def text_to_image(self, prompt: str, **kwargs) -> bytes:
+    def text_to_image(self, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         使用Cloudflare API从文本生成图像（同步调用）。
 
@@ -36,16 +36,20 @@ class CloudflareProvider(ImageProvider):
                 - seed (int)
 
         Returns:
-            bytes: 生成的PNG图像字节内容。
+            Iterator[bytes]: 生成的PNG图像字节内容（分块）。
         """
-        headers = {"Authorization": f"Bearer {self._api_token}"}
         payload = {"prompt": prompt, **kwargs}
 
-        response = requests.post(self._base_url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.content
+        response = SESSION.post(
+            self._base_url,
+            json=payload,
+            headers=self._headers,
+            stream=True,
+            timeout=REQUEST_TIMEOUT
+        )
+        return self._stream_response(response)
 
-    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> bytes:
+    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         使用Cloudflare API从图像和文本生成新图像（同步调用）。
 
@@ -62,20 +66,24 @@ class CloudflareProvider(ImageProvider):
                 - seed (int)
 
         Returns:
-            bytes: 生成的PNG图像字节内容。
+            Iterator[bytes]: 生成的PNG图像字节内容（分块）。
         """
-        headers = {"Authorization": f"Bearer {self._api_token}"}
-        # 将输入图像转换为base64编码
-        image_b64 = base64.b64encode(input_image).decode("utf-8")
+        # 将输入图像转换为base64编码（接口仅接受JSON；直接调用binascii，省去base64模块的包装）
+        image_b64 = binascii.b2a_base64(memoryview(input_image), newline=False).decode("ascii")
         payload = {
             "prompt": prompt,
             "image_b64": image_b64,
             **kwargs
         }
 
-        response = requests.post(self._base_url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.content
+        response = SESSION.post(
+            self._base_url,
+            json=payload,
+            headers=self._headers,
+            stream=True,
+            timeout=REQUEST_TIMEOUT
+        )
+        return self._stream_response(response)
 
 
 # Cloudflare工厂类
@@ -90,15 +98,21 @@ class CloudflareFactory:
         """
         self._account_id = account_id
         self._api_token = api_token
+        self._providers: dict[str, CloudflareProvider] = {}
 
     def create_provider(self, model_name: str) -> CloudflareProvider:
         """
-        根据模型名创建Cloudflare提供者实例。
+        根据模型名获取Cloudflare提供者实例。
 
         Args:
             model_name (str): 模型名称，例如"@cf/runwayml/stable-diffusion-v1-5-img2img"。
 
         Returns:
-            CloudflareProvider: 提供者实例。
+            CloudflareProvider: 提供者实例，同一模型复用已创建的实例。
         """
-        return CloudflareProvider(self._account_id, self._api_token, model_name)
+        provider = self._providers.get(model_name)
+        if provider is None:
+            provider = CloudflareProvider(self._account_id, self._api_token, model_name)
+            if len(self._providers) < MAX_CACHED_PROVIDERS:
+                self._providers[model_name] = provider
+        return provider
@@ -1,8 +1,8 @@
-import json
+from typing import Iterator
 
-import requests
+import orjson
 
-from providers.provider import ImageProvider
+from providers.provider import MAX_CACHED_PROVIDERS, REQUEST_TIMEOUT, SESSION, ImageProvider
 
 
 # ModelScope提供者类
@@ -18,8 +18,12 @@ class ModelScopeProvider(ImageProvider):
         self._api_token = api_token
         self._model_name = model_name
         self._base_url = "https://api-inference.modelscope.cn/v1/images/generations"
+        self._headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        }
 
-    def text_to_image(self, prompt: str, **kwargs) -> bytes:
+    def text_to_image(self, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         使用ModelScope API从文本生成图像（同步调用，返回URL后下载）。
 
@@ -28,33 +32,27 @@ class ModelScopeProvider(ImageProvider):
             **kwargs: 可选参数（假设支持，实际需参考API文档）。
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
         """
-        headers = {
-            "Authorization": f"Bearer {self._api_token}",
-            "Content-Type": "application/json"
-        }
         payload = {
             "model": self._model_name,
             "prompt": prompt,
             **kwargs  # 可扩展支持其他参数，如width、height等（需API支持）
         }
 
-        # 发送请求生成图像
-        response = requests.post(
+        # 发送请求生成图像（请求体由orjson一次编码为UTF-8字节，Content-Type已在self._headers中）
+        response = SESSION.post(
             self._base_url,
-            data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
-            headers=headers
+            data=orjson.dumps(payload),
+            headers=self._headers,
+            timeout=REQUEST_TIMEOUT
         )
         response.raise_for_status()
 
         # 解析返回的图像URL并下载
-        response_data = response.json()
+        response_data = orjson.loads(response.content)
         image_url = response_data["images"][0]["url"]
-        image_response = requests.get(image_url)
-        image_response.raise_for_status()
-
-        return image_response.content
+        return self._download_image(image_url)
 
 
 # ModelScope工厂类
@@ -67,15 +65,21 @@ class ModelScopeFactory:
             api_token (str): ModelScope API令牌。
         """
         self._api_token = api_token
+        self._providers: dict[str, ModelScopeProvider] = {}
 
     def create_provider(self, model_name: str) -> ModelScopeProvider:
         """
-        根据模型名创建ModelScope提供者实例。
+        根据模型名获取ModelScope提供者实例。
 
         Args:
             model_name (str): 模型名称，例如"MAILAND/majicflus_v1"。
 
         Returns:
-            ModelScopeProvider: 提供者实例。
+            ModelScopeProvider: 提供者实例，同一模型复用已创建的实例。
         """
-        return ModelScopeProvider(self._api_token, model_name)
+        provider = self._providers.get(model_name)
+        if provider is None:
+            provider = ModelScopeProvider(self._api_token, model_name)
+            if len(self._providers) < MAX_CACHED_PROVIDERS:
+                self._providers[model_name] = provider
+        return provider
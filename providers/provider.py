@@ -1,6 +1,27 @@
 import time
 from abc import ABC
-from typing import Callable
+from typing import Callable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 下载生成图像时每次读取的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 每个工厂最多缓存的提供者实例数（ModelScope接受任意模型名）
+MAX_CACHED_PROVIDERS = 128
+
+# 上游HTTP请求的超时时间（秒）：(连接, 读取)
+REQUEST_TIMEOUT = (10, 120)
+
+# 所有提供者共享的HTTP会话，复用连接以避免每次请求重新握手
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+))
 
 
 class ImageProvider(ABC):
@@ -9,7 +30,7 @@ class ImageProvider(ABC):
     子类需实现具体提供者的API调用逻辑。
     """
 
-    def generate(self, task: str, **params) -> bytes:
+    def generate(self, task: str, **params) -> Iterator[bytes]:
         """
         统一生成图像的接口，支持文生图和图文生图。
 
@@ -21,7 +42,7 @@ class ImageProvider(ABC):
                 - 其他提供者特定参数。
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
 
         Raises:
             ValueError: 如果任务类型无效或缺少必要参数。
@@ -41,7 +62,7 @@ class ImageProvider(ABC):
         else:
             raise ValueError(f"Unsupported task type: {task}. Use 'text_to_image' or 'image_to_image'.")
 
-    def text_to_image(self, prompt: str, **kwargs) -> bytes:
+    def text_to_image(self, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         从文本生成图像，默认抛出未实现错误。
 
@@ -50,14 +71,14 @@ class ImageProvider(ABC):
             **kwargs: 提供者特定参数。
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
 
         Raises:
             NotImplementedError: 如果提供者不支持该功能。
         """
         raise NotImplementedError("This provider does not support text-to-image generation.")
 
-    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> bytes:
+    def image_to_image(self, input_image: bytes, prompt: str, **kwargs) -> Iterator[bytes]:
         """
         从图像和文本生成新图像，默认抛出未实现错误。
 
@@ -67,19 +88,65 @@ class ImageProvider(ABC):
             **kwargs: 提供者特定参数。
 
         Returns:
-            bytes: 生成图像的字节内容。
+            Iterator[bytes]: 生成图像的字节内容（分块）。
 
         Raises:
             NotImplementedError: 如果提供者不支持该功能。
         """
         raise NotImplementedError("This provider does not support image-to-image generation.")
 
+    @staticmethod
+    def _iter_chunks(response: requests.Response) -> Iterator[bytes]:
+        """
+        按块读取HTTP响应体，读取结束后关闭连接。
+
+        Args:
+            response (requests.Response): 以stream=True发起的请求的响应。
+
+        Returns:
+            Iterator[bytes]: 响应体的字节内容（分块）。
+        """
+        try:
+            yield from response.iter_content(CHUNK_SIZE)
+        finally:
+            response.close()
+
+    @classmethod
+    def _stream_response(cls, response: requests.Response) -> Iterator[bytes]:
+        """
+        检查流式响应的状态码，HTTP错误在返回前即抛出，并先关闭连接使其归还连接池。
+
+        Args:
+            response (requests.Response): 以stream=True发起的请求的响应。
+
+        Returns:
+            Iterator[bytes]: 响应体的字节内容（分块）。
+        """
+        if not response.ok:
+            response.close()
+            response.raise_for_status()
+        return cls._iter_chunks(response)
+
+    @classmethod
+    def _download_image(cls, image_url: str) -> Iterator[bytes]:
+        """
+        流式下载图像，HTTP错误在返回前即抛出。
+
+        Args:
+            image_url (str): 图像URL。
+
+        Returns:
+            Iterator[bytes]: 图像的字节内容（分块）。
+        """
+        return cls._stream_response(SESSION.get(image_url, stream=True, timeout=REQUEST_TIMEOUT))
+
     @staticmethod
     def _poll_for_result(status_func: Callable[[str], str],
                         result_func: Callable[[str], bytes],
                         task_id: str,
                         timeout: float = 60,
-                        poll_interval: float = 5) -> bytes:
+                        poll_interval: float = 0.5,
+                        max_poll_interval: float = 10) -> bytes:
         """
         异步任务轮询辅助方法，检查任务状态并返回结果。
 
@@ -88,7 +155,8 @@ class ImageProvider(ABC):
             result_func (Callable[[str], bytes]): 获取任务结果的函数，接受task_id返回图像内容。
             task_id (str): 任务ID。
             timeout (float): 最大等待时间（秒），默认60秒。
-            poll_interval (float): 轮询间隔（秒），默认5秒。
+            poll_interval (float): 初始轮询间隔（秒），默认0.5秒，之后每次乘以1.5。
+            max_poll_interval (float): 最大轮询间隔（秒），默认10秒。
 
         Returns:
             bytes: 生成图像的字节内容。
@@ -97,12 +165,18 @@ class ImageProvider(ABC):
             TimeoutError: 如果任务超时。
             ValueError: 如果任务失败。
         """
-        start_time = time.time()
-        while time.time() - start_time < timeout:
+        deadline = time.monotonic() + timeout
+        interval = poll_interval
+        while True:
             status = status_func(task_id)
             if status == "complete":
                 return result_func(task_id)
             elif status == "failed":
                 raise ValueError(f"Task {task_id} failed.")
-            time.sleep(poll_interval)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # 指数退避：快速任务尽早返回，慢任务不频繁请求状态接口
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 1.5, max_poll_interval)
         raise TimeoutError(f"Task {task_id} did not complete within {timeout} seconds.")